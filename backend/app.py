@@ -3,24 +3,155 @@
 # Flask API Server for Multi-Track Synthesizer
 # ============================================================================
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from synthesizer_backend import SynthesizerBackend
-from audio_processor import AudioProcessor
+from synthesizer_backend import (SynthesizerBackend, init_worker_backend,
+                                 process_track_input_batch_worker)
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import io
 import json
 import logging
+import multiprocessing
+import os
+import queue
+import threading
+from functools import partial
 from pathlib import Path
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes NumPy arrays as lists"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        return DefaultJSONProvider.default(o)
+
+def pack_ndarray(o):
+    """msgpack hook: send NumPy arrays as raw little-endian float32 bytes"""
+    if isinstance(o, np.ndarray):
+        return o.astype('<f4').tobytes()
+    raise TypeError(f"Object of type {type(o).__name__} is not msgpack serializable")
 
 app = Flask(__name__)
+app.json = NumpyJSONProvider(app)
 CORS(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize backend
-backend = SynthesizerBackend(sample_rate=44100, output_dir="output")
-audio_processor = AudioProcessor(sr=44100)
+# Initialize backend. Spawned synthesis workers re-import this module as
+# __mp_main__ but build their own backend in init_worker_backend, so they
+# skip these and the audio processor's librosa/Numba import
+if __name__ != '__mp_main__':
+    from audio_processor import AudioProcessor
+    backend = SynthesizerBackend(sample_rate=44100, output_dir="output")
+    audio_processor = AudioProcessor(sr=44100)
+
+# Synthesize requests are pooled and rendered in batches; each batch runs
+# in a worker process so mixing/FFT work stays off the request threads and
+# spreads across cores. Workers are spawned rather than forked since the
+# pool starts them from the batching thread. Spawned workers re-import this
+# module, so the pool and batching thread are only created on first use.
+# Each worker is single-threaded (see init_worker_backend), so the pool
+# size alone sets how many cores synthesis uses.
+SYNTH_MAX_BATCH = 8
+SYNTH_WORKERS = os.cpu_count() or 1
+SYNTH_TIMEOUT = 120  # seconds a request waits for its batch
+synth_queue = queue.Queue()
+synth_pool = None
+synth_thread = None
+synth_lock = threading.Lock()
+
+# Limits batches in flight to the number of workers, so requests that
+# arrive while every worker is busy accumulate into the next batch
+synth_slots = threading.BoundedSemaphore(SYNTH_WORKERS)
+
+def get_synth_pool(broken=None):
+    """
+    Return the synthesis process pool, creating it on first use; passing the
+    pool that raised BrokenProcessPool (a worker was killed or crashed)
+    replaces it, since a broken pool rejects all further work
+    """
+    global synth_pool
+    with synth_lock:
+        if synth_pool is None or synth_pool is broken:
+            if broken is not None:
+                logger.warning("Synthesis process pool is broken, starting a new one")
+                broken.shutdown(wait=False, cancel_futures=True)
+            synth_pool = ProcessPoolExecutor(max_workers=SYNTH_WORKERS,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=init_worker_backend,
+                                             initargs=(backend.sample_rate, str(backend.output_dir)))
+        return synth_pool
+
+def ensure_synthesis_worker():
+    """Start the batching thread on first use, or again if it has died"""
+    global synth_thread
+    with synth_lock:
+        if synth_thread is None or not synth_thread.is_alive():
+            if synth_thread is not None:
+                logger.warning("Synthesis batching thread died, restarting it")
+            synth_thread = threading.Thread(target=synthesis_worker, daemon=True)
+            synth_thread.start()
+
+def resolve_synthesis_batch(batch, pool, pool_future):
+    """Hand a finished batch's results back to the waiting requests"""
+    synth_slots.release()
+    try:
+        results = pool_future.result()
+        for (_, future), result in zip(batch, results):
+            # The file was written in a worker, so this process learns its
+            # peaks here rather than through save_wav
+            if result['success']:
+                backend.cache_file_peaks(result['wav_file'], result['fft_data']['peak_frequencies'])
+            future.set_result(result)
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            get_synth_pool(broken=pool)
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+
+def synthesis_worker():
+    """Drain pooled synthesize requests and submit them as one batch"""
+    while True:
+        # Wait for a free worker and the first request, then take whatever
+        # else is waiting
+        synth_slots.acquire()
+        batch = [synth_queue.get()]
+        while len(batch) < SYNTH_MAX_BATCH:
+            try:
+                batch.append(synth_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        track_data_list = [data for data, _ in batch]
+        try:
+            pool = get_synth_pool()
+            try:
+                pool_future = pool.submit(process_track_input_batch_worker, track_data_list)
+            except BrokenProcessPool:
+                # The pool died after the previous batch; this one never
+                # started, so it is safe to retry once on a fresh pool
+                pool = get_synth_pool(broken=pool)
+                pool_future = pool.submit(process_track_input_batch_worker, track_data_list)
+        except Exception as e:
+            synth_slots.release()
+            for _, future in batch:
+                future.set_exception(e)
+            continue
+        
+        pool_future.add_done_callback(partial(resolve_synthesis_batch, batch, pool))
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -32,7 +163,13 @@ def upload_audio():
     """
     Process uploaded audio file and extract track information
     
-    Expected JSON:
+    Preferred: the raw file as the request body with an audio/* Content-Type
+    (e.g. audio/wav).
+    
+    Also accepted: multipart/form-data with the audio in a "file" field; the
+    upload is spooled by Werkzeug and decoded straight from its stream.
+    
+    Legacy JSON (base64 is ~4/3 the size of the file):
     {
         "filename": "song.mp3",
         "file_data": "base64_encoded_file_data",
@@ -40,7 +177,27 @@ def upload_audio():
     }
     """
     try:
-        data = request.get_json()
+        if request.mimetype.startswith('audio/'):
+            audio_bytes = request.get_data(cache=False)
+            
+            if not audio_bytes:
+                return jsonify({'error': 'Empty audio body in request'}), 400
+            
+            # Process the uploaded audio
+            result = audio_processor.process_audio_file(io.BytesIO(audio_bytes), request.mimetype)
+            
+            return jsonify(result), 200
+        
+        if 'file' in request.files:
+            file = request.files['file']
+            file_type = request.form.get('file_type', file.mimetype or 'audio/wav')
+            
+            # Process the uploaded audio
+            result = audio_processor.process_audio_file(file.stream, file_type)
+            
+            return jsonify(result), 200
+        
+        data = request.get_json(silent=True)
         
         if not data or 'file_data' not in data:
             return jsonify({'error': 'Missing file_data in request'}), 400
@@ -63,6 +220,10 @@ def synthesize():
     """
     Synthesize audio from track specifications
     
+    The response is JSON unless the request sends
+    "Accept: application/msgpack", in which case it is MessagePack with
+    graph_data/fft_data arrays as raw little-endian float32 bytes.
+    
     Expected JSON:
     {
         "tracks": [
@@ -82,12 +243,22 @@ def synthesize():
         if not data or 'tracks' not in data:
             return jsonify({'error': 'Missing tracks in request'}), 400
         
-        result = backend.process_track_input(data)
+        # Hand off to the batching worker and wait for this request's result
+        ensure_synthesis_worker()
+        future = Future()
+        synth_queue.put((data, future))
+        try:
+            result = future.result(timeout=SYNTH_TIMEOUT)
+        except FutureTimeoutError:
+            return jsonify({'error': 'Synthesis timed out'}), 504
+        status = 200 if result['success'] else 400
         
-        if result['success']:
-            return jsonify(result), 200
-        else:
-            return jsonify(result), 400
+        if msgpack is not None and request.accept_mimetypes.best_match(
+                ['application/json', 'application/msgpack']) == 'application/msgpack':
+            body = msgpack.packb(result, default=pack_ndarray, use_bin_type=True)
+            return Response(body, status=status, mimetype='application/msgpack')
+        
+        return jsonify(result), status
             
     except Exception as e:
         logger.error(f"Error in synthesize endpoint: {e}")
@@ -114,17 +285,13 @@ def verify_frequency():
         if not wav_file:
             return jsonify({'error': 'Missing wav_file'}), 400
         
-        # Read WAV file
-        from scipy.io import wavfile
         wav_path = backend.output_dir / wav_file
         
         if not wav_path.exists():
             return jsonify({'error': 'WAV file not found'}), 404
         
-        _, samples = wavfile.read(str(wav_path))
-        
-        # Verify frequency
-        result = backend.verify_frequency_accuracy(samples, expected_freq, tolerance)
+        # Verify frequency (FFT peaks are cached per file)
+        result = backend.verify_file_frequency(wav_file, expected_freq, tolerance)
         
         return jsonify(result), 200
         
@@ -150,24 +317,26 @@ def download_audio(filename):
 @app.route('/api/midi-notes', methods=['GET'])
 def get_midi_notes():
     """Get MIDI note to frequency mapping"""
-    midi_notes = {}
-    for note in range(128):
-        # MIDI note to frequency: f = 440 * 2^((n-69)/12)
-        freq = 440 * (2 ** ((note - 69) / 12))
-        midi_notes[note] = {
-            'note': note,
-            'frequency': round(freq, 2),
-            'name': get_note_name(note)
-        }
-    
-    return jsonify(midi_notes), 200
+    return Response(_MIDI_NOTES_JSON, status=200, mimetype='application/json')
 
 def get_note_name(midi_note):
     """Convert MIDI note number to note name"""
-    notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
     octave = (midi_note // 12) - 1
-    note_name = notes[midi_note % 12]
+    note_name = _NOTES[midi_note % 12]
     return f"{note_name}{octave}"
 
+# MIDI note to frequency: f = 440 * 2^((n-69)/12)
+# The mapping is static, so build and serialize it once at import
+_NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+_MIDI_NOTE_TABLE = {
+    note: {
+        'note': note,
+        'frequency': round(440 * (2 ** ((note - 69) / 12)), 2),
+        'name': get_note_name(note)
+    }
+    for note in range(128)
+}
+_MIDI_NOTES_JSON = json.dumps(_MIDI_NOTE_TABLE)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
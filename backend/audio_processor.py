@@ -2,9 +2,67 @@ import numpy as np
 import librosa
 import soundfile as sf
 from scipy import signal
+from scipy.fft import rfft, irfft, next_fast_len
+from numba import njit
 import json
 import base64
 import io
+from functools import lru_cache
+from math import gcd
+
+# Uncompressed/lossless formats libsndfile decodes directly
+SOUNDFILE_TYPES = {'audio/wav', 'audio/x-wav', 'audio/wave', 'audio/flac', 'audio/x-flac'}
+
+# Cap on rows x FFT length per batched autocorrelation (~16 MB each for the
+# float32 rows and their complex64 spectrum); a single longer segment still
+# gets a chunk of its own
+AUTOCORR_CHUNK_SAMPLES = 1 << 22
+
+@njit(["float64(float32[:], int64, int64)"], cache=True, fastmath=True)
+def _autocorr_peak_lag(autocorr, min_period, max_period):
+    """
+    Find the strongest autocorrelation lag in [min_period, max_period) and
+    refine it to sub-sample accuracy with 3-point parabolic interpolation
+    """
+    peak = min_period
+    for i in range(min_period + 1, max_period):
+        if autocorr[i] > autocorr[peak]:
+            peak = i
+
+    lag = float(peak)
+    if 0 < peak < len(autocorr) - 1:
+        a = autocorr[peak - 1]
+        b = autocorr[peak]
+        c = autocorr[peak + 1]
+        # Only refine true local maxima; a peak pinned to the edge of the
+        # search range would extrapolate far outside it
+        if b >= a and b >= c:
+            denom = a - 2.0 * b + c
+            if denom < 0.0:
+                lag += 0.5 * (a - c) / denom
+
+    return lag
+
+@njit(["float64[:](float32[:, :], int64, int64[:])"], cache=True, fastmath=True)
+def _autocorr_peak_lags(autocorr, min_period, max_periods):
+    """
+    Row-wise _autocorr_peak_lag over a batch of autocorrelations, each with
+    its own upper search bound
+    """
+    lags = np.empty(autocorr.shape[0])
+    for row in range(autocorr.shape[0]):
+        lags[row] = _autocorr_peak_lag(autocorr[row], min_period, max_periods[row])
+    return lags
+
+@lru_cache(maxsize=32)
+def _hann_window(n):
+    """
+    Cached float32 Hann window of length n; onset segments cluster around a
+    few lengths, so this avoids rebuilding the same window per onset
+    """
+    window = signal.windows.hann(n).astype(np.float32)
+    window.setflags(write=False)
+    return window
 
 class AudioProcessor:
     def __init__(self, sr=44100):
@@ -14,13 +72,23 @@ class AudioProcessor:
         """
         Process uploaded audio file and extract frequency/note information
         """
+        # Decode base64 file data; BytesIO shares the decoded buffer
+        # rather than copying it
+        try:
+            audio_file = io.BytesIO(base64.b64decode(file_data))
+        except Exception as e:
+            raise Exception(f"Audio processing failed: {str(e)}")
+        
+        return self.process_audio_file(audio_file, file_type)
+    
+    def process_audio_file(self, audio_file, file_type):
+        """
+        Process a seekable audio file object (e.g. a multipart upload stream)
+        and extract frequency/note information without buffering it in memory
+        """
         try:
-            # Decode base64 file data
-            audio_bytes = base64.b64decode(file_data)
-            audio_file = io.BytesIO(audio_bytes)
-            
             # Load audio file
-            y, sr = librosa.load(audio_file, sr=self.sr)
+            y, sr = self._load_audio(audio_file, file_type)
             
             # Extract frequency information using STFT
             D = librosa.stft(y)
@@ -41,6 +109,29 @@ class AudioProcessor:
         except Exception as e:
             raise Exception(f"Audio processing failed: {str(e)}")
     
+    def _load_audio(self, audio_file, file_type):
+        """
+        Decode audio to mono float32 at the processor sample rate
+        
+        WAV/FLAC are read straight through soundfile and only resampled if
+        needed; everything else (or a file soundfile rejects) goes through
+        librosa's general loader.
+        """
+        if file_type in SOUNDFILE_TYPES:
+            try:
+                y, sr = sf.read(audio_file, dtype='float32', always_2d=False)
+            except RuntimeError:
+                audio_file.seek(0)
+            else:
+                if y.ndim > 1:
+                    y = y.mean(axis=1, dtype=np.float32)
+                if sr != self.sr:
+                    g = gcd(self.sr, sr)
+                    y = signal.resample_poly(y, self.sr // g, sr // g).astype(np.float32)
+                return y, self.sr
+        
+        return librosa.load(audio_file, sr=self.sr)
+    
     def _extract_tracks(self, y, sr, frequencies, S):
         """
         Extract individual tracks/notes from audio
@@ -50,64 +141,93 @@ class AudioProcessor:
         # Use onset detection to find note boundaries
         onset_frames = librosa.onset.onset_detect(y=y, sr=sr)
         onset_times = librosa.frames_to_time(onset_frames, sr=sr)
+        onset_samples = librosa.frames_to_samples(onset_frames)
         
-        # For each onset, extract the dominant frequency
-        for i, onset_time in enumerate(onset_times):
-            # Get the next onset time or end of audio
-            if i < len(onset_times) - 1:
-                end_time = onset_times[i + 1]
-            else:
-                end_time = len(y) / sr
-            
-            duration = end_time - onset_time
-            
-            # Extract audio segment
-            start_sample = int(onset_time * sr)
-            end_sample = int(end_time * sr)
-            segment = y[start_sample:end_sample]
-            
-            # Get dominant frequency using autocorrelation
-            frequency = self._get_dominant_frequency(segment, sr)
-            
+        # Each note runs to the next onset or the end of audio
+        end_times = np.append(onset_times[1:], len(y) / sr)
+        end_samples = np.append(onset_samples[1:], len(y))
+        
+        # Get dominant frequency of every segment in one batch
+        segments = [y[start:end] for start, end in zip(onset_samples, end_samples)]
+        segment_freqs = self._get_dominant_frequencies(segments, sr)
+        
+        for onset_time, end_time, frequency in zip(onset_times, end_times, segment_freqs):
             if frequency > 0:  # Only add if valid frequency detected
                 tracks.append({
                     "frequency": float(frequency),
-                    "duration": float(duration),
+                    "duration": float(end_time - onset_time),
                     "velocity": 100,
                     "startTime": float(onset_time)
                 })
         
         return tracks
     
-    def _get_dominant_frequency(self, audio_segment, sr):
+    def _get_dominant_frequencies(self, audio_segments, sr):
         """
-        Get the dominant frequency of an audio segment using autocorrelation
+        Get the dominant frequency of several audio segments using a single
+        batched FFT autocorrelation; segments with no valid estimate get 0
         """
-        if len(audio_segment) < 2:
-            return 0
-        
-        # Apply window
-        windowed = audio_segment * signal.windows.hann(len(audio_segment))
-        
-        # Compute autocorrelation
-        autocorr = np.correlate(windowed, windowed, mode='full')
-        autocorr = autocorr[len(autocorr)//2:]
-        autocorr = autocorr / autocorr[0]
+        lengths = np.array([len(segment) for segment in audio_segments], dtype=np.int64)
+        result = np.zeros(len(audio_segments))
         
         # Find the first peak (fundamental frequency)
         min_period = sr // 2000  # Minimum frequency: 20 Hz
-        max_period = sr // 50    # Maximum frequency: 2000 Hz
+        max_periods = np.full(len(audio_segments), sr // 50, dtype=np.int64)  # Maximum frequency: 2000 Hz
+        
+        too_short = max_periods > lengths
+        max_periods[too_short] = lengths[too_short] - 1
+        
+        valid = np.flatnonzero((lengths >= 2) & (min_period < max_periods))
+        if len(valid) == 0:
+            return result
         
-        if max_period > len(autocorr):
-            max_period = len(autocorr) - 1
+        # Only lags up to max_period are read, so padding each segment by
+        # max_period avoids circular wrap-around without doubling its length
+        max_lag = int(max_periods[valid].max())
         
-        if min_period >= max_period:
-            return 0
+        # Sort by length so rows in a chunk pad only to similar lengths, and
+        # cap each chunk's rows x FFT size so one long segment (a held note)
+        # cannot inflate the whole batch
+        order = valid[np.argsort(lengths[valid], kind='stable')]
+        n_ffts = [next_fast_len(int(lengths[i]) + max_lag, real=True) for i in order]
+        peak_lags = np.empty(len(order))
+        
+        chunk_start = 0
+        while chunk_start < len(order):
+            chunk_end = chunk_start + 1
+            while (chunk_end < len(order) and
+                   (chunk_end + 1 - chunk_start) * n_ffts[chunk_end] <= AUTOCORR_CHUNK_SAMPLES):
+                chunk_end += 1
+            
+            chunk = order[chunk_start:chunk_end]
+            peak_lags[chunk_start:chunk_end] = self._autocorr_chunk_peak_lags(
+                audio_segments, chunk, lengths, n_ffts[chunk_end - 1],
+                min_period, max_periods[chunk], max_lag)
+            chunk_start = chunk_end
         
-        peak_idx = min_period + np.argmax(autocorr[min_period:max_period])
+        positive = peak_lags > 0
+        result[order[positive]] = sr / peak_lags[positive]
+        
+        return result
+    
+    def _autocorr_chunk_peak_lags(self, audio_segments, chunk, lengths, n_fft,
+                                  min_period, max_periods, max_lag):
+        """
+        Peak autocorrelation lag of each segment in chunk, computed with one
+        batched float32 FFT over a zero-padded matrix
+        """
+        # Window each segment into a zero-padded matrix, one row per segment
+        windowed = np.zeros((len(chunk), n_fft), dtype=np.float32)
+        for row, i in enumerate(chunk):
+            windowed[row, :lengths[i]] = audio_segments[i] * _hann_window(lengths[i])
         
-        if peak_idx > 0:
-            frequency = sr / peak_idx
-            return frequency
+        # Compute autocorrelation of all rows via FFT (Wiener-Khinchin),
+        # cropped to the lags we search
+        spectrum = rfft(windowed, axis=1)
+        del windowed
+        np.multiply(spectrum, np.conj(spectrum), out=spectrum)
+        autocorr = irfft(spectrum, n_fft, axis=1)[:, :max_lag + 1]
         
-        return 0
+        # Range-limited argmax + parabolic refinement in a compiled kernel;
+        # the peak is scale-invariant so no normalization is needed
+        return _autocorr_peak_lags(autocorr, min_period, max_periods)
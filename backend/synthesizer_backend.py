@@ -11,14 +11,27 @@
 
 import numpy as np
 import scipy.signal as signal
-from scipy.io import wavfile
-from scipy.fft import fft, fftfreq
+import soundfile as sf
+from scipy.fft import rfftfreq, next_fast_len
 import json
+import itertools
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from typing import List, Tuple, Dict
 import logging
 
+# Prefer FFTW with its plan cache: planning a length-N transform costs far
+# more than executing it, and requests keep hitting the same lengths
+try:
+    import pyfftw
+    from pyfftw.interfaces.scipy_fft import rfft
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+except ImportError:
+    from scipy.fft import rfft
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -29,17 +42,30 @@ logger = logging.getLogger(__name__)
 class SynthesizerBackend:
     """Backend processor for the multi-track synthesizer"""
     
-    def __init__(self, sample_rate: int = 44100, output_dir: str = "output"):
+    def __init__(self, sample_rate: int = 44100, output_dir: str = "output",
+                 cache_size: int = 16, fft_workers: int = -1):
         """
         Initialize the synthesizer backend
         
         Args:
             sample_rate: Audio sample rate in Hz (default: 44100)
             output_dir: Directory for output files
+            cache_size: Number of recent WAV files whose FFT peaks are
+                        kept in memory (default: 16)
+            fft_workers: Threads per FFT, -1 for all cores (default: -1)
         """
         self.sample_rate = sample_rate
+        self.fft_workers = fft_workers
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        
+        # LRU cache of FFT peak frequencies keyed by WAV filename
+        self.cache_size = cache_size
+        self._peak_cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
+        # Output file numbering, seeded once from the files already present
+        self._file_counter = itertools.count(len(list(self.output_dir.glob('output_*.wav'))))
         logger.info(f"Initialized backend with sample rate: {sample_rate} Hz")
     
     def read_verilog_samples(self, input_file: str) -> np.ndarray:
@@ -73,8 +99,12 @@ class SynthesizerBackend:
         Returns:
             NumPy array of audio samples
         """
-        t = np.linspace(0, duration, int(self.sample_rate * duration), False)
-        samples = amplitude * np.sin(2 * np.pi * frequency * t)
+        # Build the phase in place in float64 (a float32 phase loses
+        # precision on long tones): n * (2*pi*f/sr); the sine goes to float32
+        phase = np.arange(int(self.sample_rate * duration), dtype=np.float64)
+        np.multiply(phase, 2 * np.pi * frequency / self.sample_rate, out=phase)
+        samples = np.sin(phase, out=np.empty(len(phase), dtype=np.float32))
+        np.multiply(samples, amplitude, out=samples)
         return samples.astype(np.int16)
     
     def generate_multi_track(self, tracks: List[Dict]) -> np.ndarray:
@@ -89,53 +119,188 @@ class SynthesizerBackend:
                    - 'start_time': Start time in seconds
                    
         Returns:
-            Mixed audio samples as NumPy array
+            Mixed audio samples as float32 NumPy array in [-1, 1]
+        """
+        return self.generate_multi_track_batch([tracks])[0]
+    
+    def generate_multi_track_batch(self, track_lists: List[List[Dict]]) -> List[np.ndarray]:
+        """
+        Generate several independent multi-track mixes in one pass
+        
+        Tracks from every mix are rendered into a single flat buffer (the
+        mixes laid end to end) sharing the same time index and scratch buffers.
+        Each distinct sine waveform is computed once and reused by every
+        track at that frequency or an exact octave above it (see
+        _plan_sine_bases).
+        
+        Args:
+            track_lists: One list of track dictionaries per mix
+                         (see generate_multi_track)
+                   
+        Returns:
+            List of mixed float32 audio sample arrays in [-1, 1], one per mix
+
+        Raises:
+            ValueError: If a track starts before 0 or has no positive
+                        duration; such a track would reach outside its own
+                        mix in the shared buffer
         """
-        # Calculate total duration
-        total_duration = max(t['start_time'] + t['duration'] for t in tracks)
-        total_samples = int(self.sample_rate * total_duration)
+        for tracks in track_lists:
+            for t in tracks:
+                if t['start_time'] < 0 or t['duration'] <= 0:
+                    raise ValueError(f"Invalid track timing: start_time={t['start_time']}, "
+                                     f"duration={t['duration']}")
+
+        # Calculate total duration of each mix
+        total_durations = [max(t['start_time'] + t['duration'] for t in tracks)
+                           for tracks in track_lists]
+        
+        # Flatten all tracks and precompute their sample offsets
+        flat_tracks = [track for tracks in track_lists for track in tracks]
+        starts = np.array([int(t['start_time'] * self.sample_rate) for t in flat_tracks])
+        lengths = np.array([int(self.sample_rate * t['duration']) for t in flat_tracks])
         
-        # Initialize output buffer
-        mixed = np.zeros(total_samples, dtype=np.float32)
+        # Each mix ends where its last track ends, counted in whole samples
+        # so no track can spill past its mix into the next one
+        mix_ids = np.repeat(np.arange(len(track_lists)), [len(tracks) for tracks in track_lists])
+        total_samples = np.zeros(len(track_lists), dtype=np.int64)
+        np.maximum.at(total_samples, mix_ids, starts + lengths)
         
-        # Generate and mix each track
-        for track in tracks:
-            start_sample = int(track['start_time'] * self.sample_rate)
-            duration = track['duration']
-            frequency = track['frequency']
-            velocity = track['velocity'] / 127.0  # Normalize to 0-1
+        # Lay the mixes end to end in one flat buffer
+        mix_offsets = np.concatenate(([0], np.cumsum(total_samples)[:-1]))
+        starts += mix_offsets[mix_ids]
+
+        # Initialize flat output buffer, plus a shared time index and
+        # scratch buffers sized to the longest track so the loop never allocates.
+        # The phase is kept in float64: a float32 phase loses precision as n
+        # grows, which is audible distortion on long notes; only the sine
+        # and mix buffers are float32
+        mixed = np.zeros(total_samples.sum(), dtype=np.float32)
+        max_len = int(lengths.max())
+        time_index = np.arange(max_len, dtype=np.float64)
+        phase_buffer = np.empty(max_len, dtype=np.float64)
+        wave_buffer = np.empty(max_len, dtype=np.float32)
+        track_buffer = np.empty(max_len, dtype=np.float32)
+
+        for base_frequency, (base_len, uses) in self._plan_sine_bases(flat_tracks, lengths).items():
+            # Generate base sine wave: sin(2*pi*f/sr * n)
+            phase = phase_buffer[:base_len]
+            np.multiply(time_index[:base_len], 2 * np.pi * base_frequency / self.sample_rate, out=phase)
+            wave = np.sin(phase, out=wave_buffer[:base_len])
+
+            # Mix each track using it; every stride-th sample of the base
+            # is the track's own sine, stride octaves being 2**k
+            for i, stride in uses:
+                n = lengths[i]
+                start_sample = starts[i]
+                velocity = flat_tracks[i]['velocity'] / 127.0  # Normalize to 0-1
+
+                samples = np.multiply(wave[:n * stride:stride], velocity, out=track_buffer[:n])
+                mixed[start_sample:start_sample + n] += samples
+
+        # Split the buffer back per mix, normalizing each to prevent clipping
+        outputs = []
+        for offset, total_duration, n in zip(mix_offsets, total_durations, total_samples):
+            mix = mixed[offset:offset + n]
+            # max/min are vectorized reductions and need no abs temporary
+            scale = 1 / max(mix.max(), -mix.min(), 1)
+            if scale < 1:
+                np.multiply(mix, scale, out=mix)
             
-            # Generate sine wave
-            samples = self.generate_sine_wave(frequency, duration, 32767 * velocity)
+            logger.info(f"Generated multi-track audio: {total_duration:.2f}s")
+            outputs.append(mix)
+        
+        return outputs
+    
+    def _plan_sine_bases(self, tracks: List[Dict], lengths: np.ndarray) -> Dict:
+        """
+        Group tracks by the sine waveform they can be cut from
+        
+        Tracks at the same frequency share one waveform. A track exactly
+        k octaves above an already planned frequency (f == base * 2**k) is
+        taken as every 2**k-th sample of that waveform, provided it is
+        already long enough; sin(2*pi*base/sr * 2**k*n) is exactly the
+        higher note, so no extra np.sin work or approximation is involved.
+        
+        Args:
+            tracks: Track dictionaries (see generate_multi_track)
+            lengths: Sample count of each track
             
-            # Add to mix
-            end_sample = start_sample + len(samples)
-            mixed[start_sample:end_sample] += samples
+        Returns:
+            Dictionary mapping base frequency to (waveform length,
+            list of (track index, sample stride))
+        """
+        by_frequency = {}
+        for i, track in enumerate(tracks):
+            by_frequency.setdefault(track['frequency'], []).append(i)
         
-        # Normalize to prevent clipping
-        max_val = np.max(np.abs(mixed))
-        if max_val > 32767:
-            mixed = (mixed / max_val) * 32767
+        bases = {}
+        for frequency in sorted(by_frequency):
+            group = by_frequency[frequency]
+            longest = max(lengths[i] for i in group)
+            
+            for base, (base_len, uses) in bases.items():
+                if base <= 0 or frequency <= base:
+                    continue
+                octaves = round(np.log2(frequency / base))
+                stride = 2 ** octaves
+                if base * stride == frequency and longest * stride <= base_len:
+                    uses.extend((i, stride) for i in group)
+                    break
+            else:
+                bases[frequency] = (longest, [(i, 1) for i in group])
         
-        logger.info(f"Generated multi-track audio: {total_duration:.2f}s")
-        return mixed.astype(np.int16)
+        return bases
     
     def save_wav(self, samples: np.ndarray, filename: str) -> str:
         """
-        Save audio samples to WAV file
+        Save audio samples to a 16-bit PCM WAV file
         
         Args:
-            samples: Audio samples (16-bit signed integers)
+            samples: Audio samples (16-bit signed integers, or floats in
+                     [-1, 1] which are converted to PCM while writing)
             filename: Output filename
             
         Returns:
             Path to saved file
         """
         output_path = self.output_dir / filename
-        wavfile.write(str(output_path), self.sample_rate, samples)
+        sf.write(str(output_path), samples, self.sample_rate, subtype='PCM_16')
         logger.info(f"Saved WAV file: {output_path}")
+        
+        self._cache_put(self._peak_cache, filename, None)
         return str(output_path)
     
+    def load_wav(self, filename: str) -> np.ndarray:
+        """
+        Load audio samples of a generated WAV file
+        
+        Args:
+            filename: WAV filename inside the output directory
+            
+        Returns:
+            Audio samples
+        """
+        samples, _ = sf.read(str(self.output_dir / filename), dtype='float32')
+        return samples
+    
+    def _cache_get(self, cache: OrderedDict, key: str):
+        """Look up key in an LRU cache, marking it most recently used"""
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    def _cache_put(self, cache: OrderedDict, key: str, value) -> None:
+        """Store key in an LRU cache (None evicts it), trimming to cache_size"""
+        with self._cache_lock:
+            cache.pop(key, None)
+            if value is not None:
+                cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+    
     def compute_fft(self, samples: np.ndarray, 
                    freq_range: Tuple[float, float] = (20, 20000)) -> Dict:
         """
@@ -148,65 +313,97 @@ class SynthesizerBackend:
         Returns:
             Dictionary with FFT results
         """
-        # Compute FFT
-        fft_result = fft(samples)
-        frequencies = fftfreq(len(samples), 1/self.sample_rate)
+        frequencies, magnitude, peaks = self._compute_fft_internal(samples, freq_range)
+        
+        return {
+            'frequencies': frequencies.tolist(),
+            'magnitude': magnitude.tolist(),
+            'peak_frequencies': frequencies[peaks].tolist(),
+            'peak_magnitudes': magnitude[peaks].tolist()
+        }
+    
+    def _compute_fft_internal(self, samples: np.ndarray, 
+                              freq_range: Tuple[float, float] = (20, 20000)
+                              ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Compute the one-sided magnitude spectrum and its dominant peaks
         
-        # Get magnitude spectrum (one-sided)
-        magnitude = np.abs(fft_result[:len(fft_result)//2])
-        frequencies = frequencies[:len(frequencies)//2]
+        Args:
+            samples: Audio samples
+            freq_range: Frequency range to analyze (Hz)
+            
+        Returns:
+            Tuple of (frequencies, normalized magnitude, peak indices); the
+            peak indices are the top 10 sorted by descending magnitude
+        """
+        # Compute FFT (real input, so only the one-sided spectrum is needed),
+        # padded to a fast length and spread over fft_workers threads
+        n_fft = next_fast_len(len(samples), real=True)
+        magnitude = np.abs(rfft(samples.astype(np.float32, copy=False), n=n_fft,
+                                workers=self.fft_workers))
+        frequencies = rfftfreq(n_fft, 1/self.sample_rate)
         
         # Normalize
-        magnitude = magnitude / np.max(magnitude)
+        magnitude /= np.max(magnitude)
         
-        # Find peaks (dominant frequencies)
-        peaks, properties = signal.find_peaks(magnitude, height=0.1, distance=50)
-        peak_freqs = frequencies[peaks]
-        peak_mags = magnitude[peaks]
+        # Find peaks (dominant frequencies), scanning only the bins inside
+        # freq_range
+        lo = np.searchsorted(frequencies, freq_range[0])
+        hi = np.searchsorted(frequencies, freq_range[1], side='right')
+        peaks, properties = signal.find_peaks(magnitude[lo:hi], height=0.1, distance=50)
+        peaks += lo
         
         # Sort by magnitude
-        sorted_idx = np.argsort(peak_mags)[::-1]
-        peak_freqs = peak_freqs[sorted_idx][:10]  # Top 10 peaks
-        peak_mags = peak_mags[sorted_idx][:10]
+        sorted_idx = np.argsort(magnitude[peaks])[::-1]
+        peaks = peaks[sorted_idx][:10]  # Top 10 peaks
         
-        logger.info(f"FFT computed: {len(peak_freqs)} peaks detected")
+        logger.info(f"FFT computed: {len(peaks)} peaks detected")
         
-        return {
-            'frequencies': frequencies.tolist(),
-            'magnitude': magnitude.tolist(),
-            'peak_frequencies': peak_freqs.tolist(),
-            'peak_magnitudes': peak_mags.tolist()
-        }
+        return frequencies, magnitude, peaks
     
-    def generate_frequency_graph_data(self, samples: np.ndarray) -> Dict:
+    def generate_frequency_graph_data(self, samples: np.ndarray, 
+                                      spectrum: Tuple[np.ndarray, np.ndarray, np.ndarray] = None,
+                                      as_arrays: bool = False) -> Dict:
         """
         Generate data for frequency graph visualization
         
         Args:
             samples: Audio samples
+            spectrum: Precomputed result of _compute_fft_internal(samples),
+                      computed here if not given
+            as_arrays: Return NumPy arrays instead of lists, for binary
+                       serialization
             
         Returns:
             Dictionary with graph data
         """
-        fft_data = self.compute_fft(samples)
+        if spectrum is None:
+            spectrum = self._compute_fft_internal(samples)
+        frequencies, magnitude, peaks = spectrum
         
         # Downsample for visualization (every 100th point)
-        freq_vis = fft_data['frequencies'][::100]
-        mag_vis = fft_data['magnitude'][::100]
+        freq_vis = frequencies[::100]
+        mag_vis = magnitude[::100]
         
-        return {
+        graph_data = {
             'frequencies': freq_vis,
             'magnitudes': mag_vis,
-            'peak_frequencies': fft_data['peak_frequencies'],
-            'peak_magnitudes': fft_data['peak_magnitudes']
+            'peak_frequencies': frequencies[peaks],
+            'peak_magnitudes': magnitude[peaks]
         }
+        
+        if as_arrays:
+            return graph_data
+        return {key: values.tolist() for key, values in graph_data.items()}
     
-    def process_track_input(self, track_data: Dict) -> Dict:
+    def process_track_input(self, track_data: Dict, as_arrays: bool = False) -> Dict:
         """
         Process track input from frontend and generate audio
         
         Args:
             track_data: Dictionary with track specifications
+            as_arrays: Return graph/FFT data as NumPy arrays instead
+                       of lists
             
         Returns:
             Dictionary with results (file path, graph data, etc.)
@@ -218,15 +415,88 @@ class SynthesizerBackend:
             # Generate audio
             samples = self.generate_multi_track(tracks)
             
+        except Exception as e:
+            logger.error(f"Error processing track input: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        
+        return self._finish_track_input(samples, as_arrays)
+    
+    def process_track_input_batch(self, track_data_list: List[Dict], 
+                                  as_arrays: bool = False) -> List[Dict]:
+        """
+        Process several track inputs, synthesizing them in one batch
+        
+        Args:
+            track_data_list: List of dictionaries with track specifications
+            as_arrays: Return graph/FFT data as NumPy arrays instead
+                       of lists
+            
+        Returns:
+            List of result dictionaries, in the same order as the inputs
+        """
+        try:
+            batch = self.generate_multi_track_batch(
+                [track_data.get('tracks', []) for track_data in track_data_list])
+        except Exception as e:
+            # One malformed input fails the whole batch; fall back to
+            # processing each input alone so only that one reports an error
+            logger.warning(f"Batched synthesis failed, retrying individually: {e}")
+            return [self.process_track_input(track_data, as_arrays) for track_data in track_data_list]
+        
+        return [self._finish_track_input(samples, as_arrays) for samples in batch]
+    
+    def _next_output_filename(self) -> str:
+        """
+        Reserve an unused output filename
+        
+        The file is created exclusively before being returned, so backends
+        in other threads or worker processes sharing the output directory
+        never pick the same name; a taken name just advances the counter.
+        
+        Returns:
+            Filename inside the output directory
+        """
+        while True:
+            filename = f"output_{next(self._file_counter)}.wav"
+            try:
+                os.close(os.open(self.output_dir / filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                return filename
+            except FileExistsError:
+                continue
+    
+    def _finish_track_input(self, samples: np.ndarray, as_arrays: bool = False) -> Dict:
+        """
+        Save generated audio and compute its analysis results
+        
+        Args:
+            samples: Mixed audio samples from generate_multi_track
+            as_arrays: Return graph/FFT data as NumPy arrays instead
+                       of lists
+            
+        Returns:
+            Dictionary with results (file path, graph data, etc.)
+        """
+        filename = None
+        try:
             # Save WAV file
-            filename = f"output_{len(os.listdir(self.output_dir))}.wav"
+            filename = self._next_output_filename()
             wav_path = self.save_wav(samples, filename)
             
+            # Compute FFT once for both the graph and verification data
+            spectrum = self._compute_fft_internal(samples)
+            
             # Generate frequency graph data
-            graph_data = self.generate_frequency_graph_data(samples)
+            graph_data = self.generate_frequency_graph_data(samples, spectrum, as_arrays)
             
-            # Compute FFT for verification
-            fft_data = self.compute_fft(samples)
+            # Only the peaks are returned; the full spectrum is not needed
+            # by the frontend and would dominate the response size
+            fft_data = {
+                'peak_frequencies': graph_data['peak_frequencies'],
+                'peak_magnitudes': graph_data['peak_magnitudes']
+            }
             
             result = {
                 'success': True,
@@ -243,6 +513,9 @@ class SynthesizerBackend:
             
         except Exception as e:
             logger.error(f"Error processing track input: {e}")
+            # The failed result names no file, so drop the reserved one
+            if filename is not None:
+                (self.output_dir / filename).unlink(missing_ok=True)
             return {
                 'success': False,
                 'error': str(e)
@@ -262,9 +535,62 @@ class SynthesizerBackend:
         Returns:
             Verification results
         """
-        fft_data = self.compute_fft(samples)
-        peak_freqs = np.array(fft_data['peak_frequencies'])
+        frequencies, _, peaks = self._compute_fft_internal(samples)
+        return self._match_peak_frequency(frequencies[peaks], expected_freq, tolerance)
+    
+    def verify_file_frequency(self, filename: str, 
+                              expected_freq: float, 
+                              tolerance: float = 0.02) -> Dict:
+        """
+        Verify that a generated WAV file contains expected frequency
+        
+        The file's FFT peaks are memoized, so repeated checks against
+        different expected frequencies reuse one spectrum.
         
+        Args:
+            filename: WAV filename inside the output directory
+            expected_freq: Expected frequency in Hz
+            tolerance: Tolerance as fraction of expected frequency
+            
+        Returns:
+            Verification results
+        """
+        peak_freqs = self._cache_get(self._peak_cache, filename)
+        if peak_freqs is None:
+            frequencies, _, peaks = self._compute_fft_internal(self.load_wav(filename))
+            peak_freqs = frequencies[peaks]
+            self._cache_put(self._peak_cache, filename, peak_freqs)
+        
+        return self._match_peak_frequency(peak_freqs, expected_freq, tolerance)
+    
+    def cache_file_peaks(self, filename: str, peak_freqs: np.ndarray) -> None:
+        """
+        Record the FFT peak frequencies of a generated WAV file
+        
+        Files written by pool workers never pass through this backend's
+        save_wav, so the server seeds its cache from each result's
+        fft_data; this also replaces stale peaks if a filename is reused.
+        
+        Args:
+            filename: WAV filename inside the output directory
+            peak_freqs: Peak frequencies in Hz, as in fft_data
+        """
+        self._cache_put(self._peak_cache, filename, np.asarray(peak_freqs))
+    
+    def _match_peak_frequency(self, peak_freqs: np.ndarray, 
+                              expected_freq: float, 
+                              tolerance: float) -> Dict:
+        """
+        Compare the FFT peak closest to the expected frequency against it
+        
+        Args:
+            peak_freqs: Detected peak frequencies in Hz
+            expected_freq: Expected frequency in Hz
+            tolerance: Tolerance as fraction of expected frequency
+            
+        Returns:
+            Verification results
+        """
         # Find closest peak to expected frequency
         closest_idx = np.argmin(np.abs(peak_freqs - expected_freq))
         detected_freq = peak_freqs[closest_idx]
@@ -274,13 +600,47 @@ class SynthesizerBackend:
         
         return {
             'expected_frequency': expected_freq,
-            'detected_frequency': detected_freq,
-            'error_percent': error * 100,
-            'is_accurate': is_accurate,
+            'detected_frequency': float(detected_freq),
+            'error_percent': float(error * 100),
+            'is_accurate': bool(is_accurate),
             'tolerance_percent': tolerance * 100
         }
 
 
+# Backend instance owned by a worker process (see init_worker_backend)
+_worker_backend = None
+
+def init_worker_backend(sample_rate: int, output_dir: str):
+    """
+    Process pool initializer: build the worker's backend once per process
+    
+    The pool already runs one worker per core, so each worker's FFTs are
+    kept single-threaded rather than oversubscribing the CPU.
+    
+    Args:
+        sample_rate: Audio sample rate in Hz
+        output_dir: Directory for output files
+    """
+    global _worker_backend
+    _worker_backend = SynthesizerBackend(sample_rate=sample_rate, output_dir=output_dir,
+                                         fft_workers=1)
+
+def process_track_input_batch_worker(track_data_list: List[Dict]) -> List[Dict]:
+    """
+    Process pool task: run process_track_input_batch on the worker's backend
+    
+    Graph data comes back as NumPy arrays, which pickle compactly and
+    let the server pick JSON or binary serialization per request.
+    
+    Args:
+        track_data_list: List of dictionaries with track specifications
+        
+    Returns:
+        List of result dictionaries, in the same order as the inputs
+    """
+    return _worker_backend.process_track_input_batch(track_data_list, as_arrays=True)
+
+
 # Example usage and API endpoints
 if __name__ == "__main__":
     backend = SynthesizerBackend()
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from synthesizer_backend import SynthesizerBackend
+
+
+class GenerateMultiTrackBatchTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.backend = SynthesizerBackend(output_dir=self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_batch_matches_individual_mixes(self):
+        a = [{'frequency': 440, 'duration': 0.5, 'velocity': 100, 'start_time': 0}]
+        b = [{'frequency': 660, 'duration': 0.3, 'velocity': 80, 'start_time': 0.1},
+             {'frequency': 880, 'duration': 0.2, 'velocity': 127, 'start_time': 0}]
+
+        for batch, mixes in zip(self.backend.generate_multi_track_batch([a, b]), [a, b]):
+            np.testing.assert_array_equal(batch, self.backend.generate_multi_track(mixes))
+
+    def test_invalid_track_cannot_write_into_another_mix(self):
+        a = [{'frequency': 440, 'duration': 0.5, 'velocity': 100, 'start_time': 0}]
+        alone = self.backend.generate_multi_track(a).copy()
+
+        for bad in ({'start_time': -0.25, 'duration': 0.5},
+                    {'start_time': 0, 'duration': -0.5},
+                    {'start_time': 0, 'duration': 0}):
+            b = [dict({'frequency': 330, 'velocity': 100}, **bad)]
+            for order in ([a, b], [b, a]):
+                with self.assertRaises(ValueError):
+                    self.backend.generate_multi_track_batch(order)
+
+        results = self.backend.process_track_input_batch([{'tracks': a}, {'tracks': b}],
+                                                         as_arrays=True)
+        self.assertTrue(results[0]['success'])
+        self.assertFalse(results[1]['success'])
+
+        saved = self.backend.load_wav(results[0]['wav_file'])
+        np.testing.assert_allclose(saved, alone, atol=1 / 32767)
+
+
+if __name__ == '__main__':
+    unittest.main()